@@ -0,0 +1,58 @@
+"""
+Train the Random Forest offline and write the artifacts loaded by main.py:
+model.joblib (the forest) and foods.npz (the food name index and nutrient
+matrix, loaded without pandas or scikit-learn)
+
+Run from the backend directory whenever the dataset or scikit-learn changes:
+    python build_model.py
+
+Also compiles the forest to rf.so when treelite, tl2cgen and gcc are available.
+rf.so is a build-time artifact for the machine that runs this script (it is
+gitignored and never deployed through git). Pass --no-compile when building
+the model.joblib that gets committed for Vercel.
+"""
+import os
+import sys
+
+import joblib
+import numpy as np
+
+from main import (
+    FEATURES,
+    FOODS_PATH,
+    MODEL_PATH,
+    compile_forest,
+    label_foods,
+    load_foods,
+    save_food_tables,
+    train_model,
+)
+
+COMPILED_LIB = "rf.so"
+
+if __name__ == "__main__":
+    foods_df = load_foods()
+    bundle = train_model(foods_df)
+
+    # The label is a deterministic rule, so the forest should reproduce it
+    X = foods_df[FEATURES].to_numpy(dtype=np.float32)
+    pred = bundle["enc"].inverse_transform(bundle["rf"].predict(X))
+    print(f"Training agreement with NAR rule: {np.mean(pred == label_foods(foods_df)):.4f}")
+
+    libpath = os.path.join(os.path.dirname(MODEL_PATH), COMPILED_LIB)
+    if "--no-compile" in sys.argv[1:]:
+        print("Note: Skipping compiled forest (--no-compile)")
+    else:
+        try:
+            compile_forest(bundle["rf"], libpath)
+            bundle["compiled_lib"] = COMPILED_LIB
+            print(f"✓ Wrote compiled forest: {libpath}")
+        except Exception as e:
+            print(f"Note: Skipping compiled forest ({e})")
+            print("  Install: pip install treelite tl2cgen")
+
+    joblib.dump(bundle, MODEL_PATH)
+    print(f"✓ Wrote model artifact: {MODEL_PATH}")
+
+    save_food_tables(foods_df)
+    print(f"✓ Wrote food tables: {FOODS_PATH}")
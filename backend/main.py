@@ -3,18 +3,32 @@
 # (SEARCH + MULTI FOOD + GRAMS + ML RANDOM FOREST)
 # =========================
 
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
-
-from fastapi import FastAPI, HTTPException, Depends
+# pandas / scikit-learn / numba are imported lazily by the model loader so
+# cold starts that never hit /predict don't pay for them
+import asyncio
+import hashlib
+import json
+import threading
+import numpy as np
+import orjson
+
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Any, Dict, List, Optional
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple
+import anyio
+from anyio.lowlevel import RunVar
 import os
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 load_dotenv()
 
 # =========================
@@ -40,21 +54,79 @@ if not DATASET_PATH:
     if not DATASET_PATH:
         raise FileNotFoundError(f"Dataset CSV not found. Tried: {possible_paths}")
 
-foods_df = pd.read_csv(DATASET_PATH)
-
 REQUIRED_COLUMNS = [
     "name", "protein_g", "iron_mg",
     "b12_mcg", "omega3_g", "cal_kcal"
 ]
 
-missing = set(REQUIRED_COLUMNS) - set(foods_df.columns)
-if missing:
-    raise ValueError(f"Missing columns in dataset: {missing}")
 
-foods_df = foods_df[REQUIRED_COLUMNS].fillna(0)
-ALL_FOODS = sorted(foods_df["name"].unique())
+# Below this size pandas' C parser beats pyarrow (and its ~100 ms import)
+PYARROW_MIN_BYTES = 8 * 1024 * 1024
+
+
+def load_foods() -> "pd.DataFrame":
+    import pandas as pd
+
+    # Validate the header first so usecols can't fail with a less useful error
+    header = pd.read_csv(DATASET_PATH, nrows=0).columns
+    missing = set(REQUIRED_COLUMNS) - set(header)
+    if missing:
+        raise ValueError(f"Missing columns in dataset: {missing}")
+
+    dtypes = {c: "float64" for c in REQUIRED_COLUMNS if c != "name"}
+    dtypes["name"] = str
+    foods_df = None
+    if os.path.getsize(DATASET_PATH) >= PYARROW_MIN_BYTES:
+        try:
+            # Arrow's multithreaded C++ reader, when pyarrow is installed
+            foods_df = pd.read_csv(
+                DATASET_PATH, engine="pyarrow", usecols=REQUIRED_COLUMNS, dtype=dtypes
+            )
+        except ImportError:
+            pass
+    if foods_df is None:
+        foods_df = pd.read_csv(DATASET_PATH, usecols=REQUIRED_COLUMNS, dtype=dtypes)
+
+    return foods_df[REQUIRED_COLUMNS].fillna(0)
+
+
+def dataset_sha256() -> str:
+    # Line endings normalized so a Windows (CRLF) checkout matches the deploy
+    with open(DATASET_PATH, "rb") as f:
+        return hashlib.sha256(f.read().replace(b"\r\n", b"\n")).hexdigest()
+
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson (C float formatting, numpy-aware).
 
-app = FastAPI()
+    Defined here rather than imported because fastapi.responses.ORJSONResponse
+    is deprecated and warns on every response in current FastAPI releases.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the food tables in the background on long-running servers (uvicorn).
+
+    The server accepts requests immediately; a request that needs them before
+    warm-up finishes waits on the same load in get_food_data(). Serverless
+    (Mangum, lifespan="off") skips this and loads lazily on first use. The
+    forest is not warmed: it is only loaded for ?use_ml=true.
+    """
+    size_threadpool()
+    warmup = asyncio.create_task(warm_food_data())
+    yield
+    warmup.cancel()
+    await close_mongo_connection()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS configuration - allow localhost and production URLs
 # In Vercel, allow all origins since frontend and backend are on same domain
@@ -92,13 +164,45 @@ JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
 JWT_ALG = "HS256"
 JWT_EXPIRE_MIN = int(os.getenv("JWT_EXPIRE_MIN", "43200"))
 
+DEFAULT_BCRYPT_ROUNDS = 10
+
+
+def _bcrypt_rounds(value: Optional[str]) -> int:
+    """Parse BCRYPT_ROUNDS; bcrypt.gensalt only accepts 4..31"""
+    if value is None:
+        return DEFAULT_BCRYPT_ROUNDS
+    try:
+        rounds = int(value)
+    except ValueError:
+        rounds = None
+    if rounds is None or not 4 <= rounds <= 31:
+        print(f"WARNING: BCRYPT_ROUNDS must be an integer from 4 to 31, got {value!r}; using {DEFAULT_BCRYPT_ROUNDS}")
+        return DEFAULT_BCRYPT_ROUNDS
+    return rounds
+
+
+# Password hashing cost: bcrypt at 10 rounds is ~4x faster than the library
+# default of 12. PASSWORD_SCHEME=argon2 switches new hashes to argon2id
+# (needs argon2-cffi); existing hashes of either scheme still verify and are
+# rehashed on the next successful login if they use the other scheme or fewer
+# bcrypt rounds. Existing 12-round bcrypt hashes are kept as they are.
+BCRYPT_ROUNDS = _bcrypt_rounds(os.getenv("BCRYPT_ROUNDS"))
+PASSWORD_SCHEME = os.getenv("PASSWORD_SCHEME", "bcrypt").lower()
+
+# History indexes; list_history hints the one matching its query shape
+HISTORY_BY_USER = [("user_id", 1), ("created_at", -1)]
+HISTORY_BY_USER_KIND = [("user_id", 1), ("kind", 1), ("created_at", -1)]
+HISTORY_PROJECTION = {"_id": 0, "kind": 1, "payload": 1, "created_at": 1}
+HISTORY_BATCH_SIZE = 50
+
 # Global MongoDB client and database
 mongo_client = None
 mongo_db = None
+history_indexes_ready = False
 
 async def connect_to_mongo():
     """Initialize MongoDB connection"""
-    global mongo_client, mongo_db
+    global mongo_client, mongo_db, history_indexes_ready
     
     if not MONGO_URI:
         print("WARNING: MONGO_URI not set. MongoDB features will be disabled.")
@@ -123,7 +227,9 @@ async def connect_to_mongo():
         try:
             await mongo_db.users.create_index("email", unique=True)
             await mongo_db.history.create_index("user_id")
-            await mongo_db.history.create_index([("user_id", 1), ("created_at", -1)])
+            await mongo_db.history.create_index(HISTORY_BY_USER)
+            await mongo_db.history.create_index(HISTORY_BY_USER_KIND)
+            history_indexes_ready = True
             print("✓ Database indexes created/verified")
         except Exception as e:
             print(f"Note: Index creation warning: {e}")
@@ -169,47 +275,66 @@ try:
     
     bearer = HTTPBearer(auto_error=False)
     
-    def hash_password(password: str) -> str:
-        """Hash a password using bcrypt, ensuring it's within 72-byte limit"""
-        if not password:
-            raise ValueError("Password cannot be empty")
+    def _password_bytes(password: str) -> bytes:
+        """Encode a password for bcrypt, truncated to its 72-byte limit"""
+        pwd_bytes = str(password).encode('utf-8')
         
-        # Convert to string and encode to bytes
-        pwd_str = str(password)
-        pwd_bytes = pwd_str.encode('utf-8')
-        
-        # Truncate to 72 bytes if needed (bcrypt limit)
         if len(pwd_bytes) > 72:
             pwd_bytes = pwd_bytes[:72]
             # Remove any incomplete UTF-8 sequences at the end
             while len(pwd_bytes) > 0 and (pwd_bytes[-1] & 0xC0) == 0x80:
                 pwd_bytes = pwd_bytes[:-1]
         
+        return pwd_bytes
+    
+    try:
+        from argon2 import PasswordHasher
+        
+        argon2_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+    except ImportError:
+        argon2_hasher = None
+        if PASSWORD_SCHEME == "argon2":
+            print("WARNING: PASSWORD_SCHEME=argon2 but argon2-cffi is not installed, using bcrypt")
+            print("  Install: pip install argon2-cffi")
+    
+    use_argon2 = PASSWORD_SCHEME == "argon2" and argon2_hasher is not None
+    
+    def hash_password(password: str) -> str:
+        """Hash a password with the configured scheme (bcrypt or argon2)"""
+        if not password:
+            raise ValueError("Password cannot be empty")
+        
+        if use_argon2:
+            return argon2_hasher.hash(str(password))
+        
         # Hash using bcrypt directly
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(pwd_bytes, salt)
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+        hashed = bcrypt.hashpw(_password_bytes(password), salt)
         return hashed.decode('utf-8')
     
     def verify_password(password: str, password_hash: str) -> bool:
-        """Verify a password against a hash, ensuring it's within 72-byte limit"""
+        """Verify a password against a bcrypt or argon2 hash"""
         if not password or not password_hash:
             return False
         
         try:
-            # Convert to string and encode to bytes
-            pwd_str = str(password)
-            pwd_bytes = pwd_str.encode('utf-8')
-            
-            # Truncate to 72 bytes if needed (bcrypt limit)
-            if len(pwd_bytes) > 72:
-                pwd_bytes = pwd_bytes[:72]
-                # Remove any incomplete UTF-8 sequences at the end
-                while len(pwd_bytes) > 0 and (pwd_bytes[-1] & 0xC0) == 0x80:
-                    pwd_bytes = pwd_bytes[:-1]
+            if password_hash.startswith("$argon2"):
+                return argon2_hasher is not None and argon2_hasher.verify(password_hash, str(password))
             
             # Verify using bcrypt directly
             hash_bytes = password_hash.encode('utf-8')
-            return bcrypt.checkpw(pwd_bytes, hash_bytes)
+            return bcrypt.checkpw(_password_bytes(password), hash_bytes)
+        except Exception:
+            return False
+    
+    def password_needs_rehash(password_hash: str) -> bool:
+        """Whether a verified hash uses another scheme or a lower cost than configured"""
+        try:
+            if use_argon2:
+                return not password_hash.startswith("$argon2") or argon2_hasher.check_needs_rehash(password_hash)
+            # bcrypt hashes look like $2b$<rounds>$<salt+hash>. Only raise the
+            # cost: stronger existing hashes are never rewritten to fewer rounds.
+            return password_hash.startswith("$argon2") or int(password_hash.split("$")[2]) < BCRYPT_ROUNDS
         except Exception:
             return False
     
@@ -263,6 +388,9 @@ except ImportError as e:
     def verify_password(*args, **kwargs):
         raise HTTPException(status_code=503, detail="Auth libraries not installed")
     
+    def password_needs_rehash(*args, **kwargs):
+        return False
+    
     def create_token(*args, **kwargs):
         raise HTTPException(status_code=503, detail="Auth libraries not installed")
     
@@ -277,6 +405,33 @@ except ImportError as e:
 # MongoDB connection will be initialized on first request
 # For Vercel serverless, we'll connect lazily
 
+# Worker threads for sync routes and run_blocking calls. The limiter is per
+# event loop: the lifespan hook sizes it at startup, and under Mangum
+# (lifespan="off") run_blocking sizes it on first use in each loop.
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "64"))
+_threadpool_sized = RunVar("threadpool_sized", default=False)
+
+
+def size_threadpool():
+    """Set the running event loop's worker thread limit to THREADPOOL_SIZE"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    _threadpool_sized.set(True)
+
+
+async def run_blocking(func, *args):
+    """Run a blocking call (bcrypt, loading the food tables) in the threadpool, off the event loop"""
+    if not _threadpool_sized.get():
+        size_threadpool()
+    return await anyio.to_thread.run_sync(func, *args)
+
+
+async def warm_food_data():
+    """Load the food tables off the event loop so startup isn't blocked by it"""
+    try:
+        await run_blocking(get_food_data)
+    except Exception as e:
+        print(f"WARNING: Food data warm-up failed, will retry on first request: {e}")
+
 # =========================
 # 2. CREATE TRAINING DATA (AUTO-LABEL USING NAR)
 # =========================
@@ -296,19 +451,29 @@ def generate_label(row, weight=60):
 
     return "Adequate" if all(v >= 1 for v in nars) else "Inadequate"
 
-foods_df["adequacy"] = foods_df.apply(generate_label, axis=1)
-
-
-def compute_requirements(weight: float) -> Dict[str, float]:
-    return {
+def label_foods(foods_df: "pd.DataFrame", weight=60) -> np.ndarray:
+    """Same rule as generate_label, evaluated column-wise"""
+    adeq = (
+        (foods_df["protein_g"].values >= weight * 1.32)
+        & (foods_df["iron_mg"].values >= weight * 0.094)
+        & (foods_df["b12_mcg"].values >= weight * 0.028)
+        & (foods_df["omega3_g"].values >= 1.1)
+    )
+    return np.where(adeq, "Adequate", "Inadequate")
+
+
+@lru_cache(maxsize=256)
+def compute_requirements(weight: float) -> Mapping[str, float]:
+    """Daily requirements for a body weight (cached, so read-only)"""
+    return MappingProxyType({
         "protein_g": float(weight) * 1.32,
         "iron_mg": float(weight) * 0.094,
         "b12_mcg": float(weight) * 0.028,
         "omega3_g": 1.1,
-    }
+    })
 
 
-def compute_deficits(totals: Dict[str, float], reqs: Dict[str, float]) -> Dict[str, float]:
+def compute_deficits(totals: Dict[str, float], reqs: Mapping[str, float]) -> Dict[str, float]:
     deficits: Dict[str, float] = {}
     for k, req in reqs.items():
         have = float(totals.get(k, 0) or 0)
@@ -322,50 +487,360 @@ def compute_deficits(totals: Dict[str, float], reqs: Dict[str, float]) -> Dict[s
 # =========================
 
 FEATURES = ["protein_g", "iron_mg", "b12_mcg", "omega3_g", "cal_kcal"]
-X = foods_df[FEATURES]
-y = foods_df["adequacy"]
 
-encoder = LabelEncoder()
-y_encoded = encoder.fit_transform(y)
+# Prebuilt by build_model.py so workers don't refit the forest on cold start
+MODEL_PATH = os.getenv("MODEL_PATH") or os.path.join(os.path.dirname(__file__), "model.joblib")
+
+# Also prebuilt: the food tables as plain NumPy arrays, so serving them needs
+# neither pandas nor scikit-learn
+FOODS_PATH = os.getenv("FOODS_PATH") or os.path.join(os.path.dirname(__file__), "foods.npz")
+
+# Small on purpose: 5 features and a label from 4 thresholds don't need more,
+# and every prediction walks every tree
+RF_PARAMS = {
+    "n_estimators": 32,
+    "max_depth": 6,
+    "random_state": 42,
+    "n_jobs": 1,
+}
+
+
+def index_foods(foods_df: "pd.DataFrame") -> Tuple[Dict[str, int], np.ndarray]:
+    """Build the name -> row index and the contiguous nutrient matrix"""
+    # Pre-extract a contiguous nutrient matrix and a name -> row index so the
+    # request path never scans the DataFrame. First occurrence wins for
+    # duplicated names, matching the previous `.iloc[0]` lookup.
+    names = foods_df["name"]
+    first = ~names.duplicated(keep="first").to_numpy()
+    food_idx: Dict[str, int] = dict(
+        zip(names.to_numpy()[first].tolist(), np.flatnonzero(first).tolist())
+    )
+
+    nutrients = foods_df[FEATURES].to_numpy(dtype=np.float64, copy=True)
+    return food_idx, nutrients
+
+
+def save_food_tables(foods_df: "pd.DataFrame") -> None:
+    """Write the deduplicated names and their nutrient rows to FOODS_PATH"""
+    food_idx, nutrients = index_foods(foods_df)
+    np.savez_compressed(
+        FOODS_PATH,
+        names=np.array(list(food_idx)),
+        nutrients=nutrients[list(food_idx.values())],
+        dataset_sha256=np.array(dataset_sha256()),
+    )
+
+
+def load_food_tables() -> Tuple[Dict[str, int], np.ndarray]:
+    """Load the food tables from FOODS_PATH, parsing the CSV if it is missing or stale"""
+    if os.path.exists(FOODS_PATH):
+        try:
+            with np.load(FOODS_PATH) as tables:
+                if str(tables["dataset_sha256"]) == dataset_sha256():
+                    names = tables["names"].tolist()
+                    return dict(zip(names, range(len(names)))), tables["nutrients"]
+            print(f"WARNING: {FOODS_PATH} is stale. Run build_model.py to rebuild it.")
+        except Exception as e:
+            print(f"WARNING: Failed to load {FOODS_PATH}: {e}")
+
+    return index_foods(load_foods())
 
-rf_model = RandomForestClassifier(
-    n_estimators=200,
-    max_depth=8,
-    random_state=42
-)
 
-rf_model.fit(X, y_encoded)
+def train_model(foods_df: "pd.DataFrame") -> Dict[str, Any]:
+    """Label the dataset, fit the forest and return the model bundle"""
+    import sklearn
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import LabelEncoder
+
+    _, nutrients = index_foods(foods_df)
+
+    # Train on the plain array (no feature_names_in_) so predict() can be fed a
+    # bare (1, 5) array without pandas construction or column-name checks.
+    encoder = LabelEncoder()
+    y_encoded = encoder.fit_transform(label_foods(foods_df))
+
+    rf_model = RandomForestClassifier(**RF_PARAMS)
+
+    rf_model.fit(nutrients.astype(np.float32), y_encoded)
+
+    return {
+        "rf": rf_model,
+        "enc": encoder,
+        "rf_params": dict(RF_PARAMS),
+        "sklearn_version": sklearn.__version__,
+        "dataset_sha256": dataset_sha256(),
+    }
+
+
+def load_model_bundle() -> Dict[str, Any]:
+    """Load the prebuilt model artifact, retraining if it is missing or stale"""
+    import joblib
+    import sklearn
+
+    if os.path.exists(MODEL_PATH):
+        try:
+            # Uncompressed on purpose: arrays are memory-mapped, not copied
+            bundle = joblib.load(MODEL_PATH, mmap_mode="r")
+            if (
+                bundle.get("rf_params") == RF_PARAMS
+                and bundle.get("sklearn_version") == sklearn.__version__
+                and bundle.get("dataset_sha256") == dataset_sha256()
+            ):
+                return bundle
+            print(f"WARNING: {MODEL_PATH} is stale. Run build_model.py to rebuild it.")
+        except Exception as e:
+            print(f"WARNING: Failed to load {MODEL_PATH}: {e}")
+
+    return train_model(load_foods())
+
+
+# =========================
+# 3b. FLATTEN FOREST FOR FAST INFERENCE
+# =========================
+
+def flatten_forest(model):
+    """Stack every tree's node arrays into flat arrays with global node ids.
+
+    Leaf values are normalized to class fractions so summing them across
+    trees and taking argmax reproduces RandomForestClassifier.predict.
+
+    Thresholds are stored as int16 ranks among the sorted split values of
+    their feature (`edges`, one +inf-padded row per feature), and inputs are
+    ranked the same way at predict time. `x <= thr` holds exactly when
+    `rank(x) <= rank(thr)`, so the smaller node arrays give identical results.
+    """
+    feats, thrs, lefts, rights, vals = [], [], [], [], []
+    offsets = [0]
+    for est in model.estimators_:
+        t = est.tree_
+        base = offsets[-1]
+        is_leaf = t.children_left == -1
+        value = t.value[:, 0, :]
+        feats.append(np.where(is_leaf, 0, t.feature).astype(np.int8))
+        thrs.append(t.threshold.astype(np.float64))
+        lefts.append(np.where(is_leaf, -1, t.children_left + base).astype(np.int32))
+        rights.append(np.where(is_leaf, -1, t.children_right + base).astype(np.int32))
+        vals.append(value / value.sum(axis=1, keepdims=True))
+        offsets.append(base + t.node_count)
+
+    feat = np.concatenate(feats)
+    thr = np.concatenate(thrs)
+    left = np.concatenate(lefts)
+    split = left != -1
+
+    split_values = [np.unique(thr[split & (feat == f)]) for f in range(model.n_features_in_)]
+    n_edges = max(len(v) for v in split_values)
+    edges = np.full((len(split_values), max(n_edges, 1)), np.inf)
+    thr_q = np.zeros(thr.shape[0], dtype=np.int16 if n_edges <= np.iinfo(np.int16).max else np.int32)
+    for f, v in enumerate(split_values):
+        mask = split & (feat == f)
+        edges[f, :len(v)] = v
+        thr_q[mask] = np.searchsorted(v, thr[mask])
+
+    return (
+        feat,
+        thr_q,
+        left,
+        np.concatenate(rights),
+        np.concatenate(vals).astype(np.float64),
+        np.asarray(offsets, dtype=np.int32),
+        edges,
+    )
+
+
+def compile_forest(model, libpath: str) -> None:
+    """Compile the forest to a native shared library with treelite + tl2cgen"""
+    import treelite
+    import tl2cgen
+
+    tl2cgen.export_lib(
+        treelite.sklearn.import_model(model),
+        toolchain="gcc",
+        libpath=libpath,
+    )
+
+
+def load_compiled_forest(bundle: Dict[str, Any]):
+    """Load the shared library built by build_model.py for this bundle, if any"""
+    lib_name = bundle.get("compiled_lib")
+    libpath = os.path.join(os.path.dirname(MODEL_PATH), lib_name or "")
+    # Build-time only: absent wherever the bundle was deployed without it
+    if not lib_name or not os.path.exists(libpath):
+        return None
+
+    try:
+        import tl2cgen
+
+        predictor = tl2cgen.Predictor(libpath)
+    except Exception as e:
+        print(f"WARNING: Failed to load compiled forest {lib_name}: {e}")
+        return None
+
+    def predict(x):
+        out = predictor.predict(tl2cgen.DMatrix(x, dtype="float32"))
+        return out.reshape(x.shape[0], -1).argmax(axis=1)
+
+    return predict
+
+
+def _forest_walk(x, feat, thr, left, right, val, offs, edges):
+    """Tree walker over flatten_forest arrays; JIT-compiled by make_predictor"""
+    n_trees = offs.shape[0] - 1
+    out = np.empty(x.shape[0], dtype=np.int64)
+    x_q = np.empty(x.shape[1], dtype=thr.dtype)
+    for b in range(x.shape[0]):
+        for f in range(x.shape[1]):
+            x_q[f] = np.searchsorted(edges[f], np.float64(x[b, f]))
+        votes = np.zeros(val.shape[1])
+        for t in range(n_trees):
+            node = offs[t]
+            while left[node] != -1:
+                if x_q[feat[node]] <= thr[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            votes += val[node]
+        out[b] = np.argmax(votes)
+    return out
+
+
+def make_predictor(bundle: Dict[str, Any]):
+    """Return the fastest available predict(x) for a (B, 5) float32 batch"""
+    try:
+        from numba import njit
+
+        walk = njit(cache=True)(_forest_walk)
+        forest = flatten_forest(bundle["rf"])
+
+        def predict(x):
+            return walk(x, *forest)
+
+        # Compile (or load from cache) now rather than on the first request
+        predict(np.zeros((1, len(FEATURES)), dtype=np.float32))
+        return predict
+
+    except Exception as e:
+        print(f"WARNING: Numba forest predictor unavailable: {e}")
+        print("  Install: pip install numba")
+
+    # Next best: the treelite library shipped with the bundle (per-call
+    # DMatrix setup makes it slower than Numba for single rows), then sklearn
+    return load_compiled_forest(bundle) or bundle["rf"].predict
+
+
+# =========================
+# 3c. LAZY MODEL LOADING
+# =========================
+
+# Loaded on first use (or warmed by the lifespan hook) instead of at import,
+# mirroring the lazy MongoDB connection for serverless cold starts.
+# The food tables come from foods.npz (or the CSV via pandas); the forest
+# (scikit-learn, numba) is loaded separately and only for ?use_ml=true.
+_food_data: Optional[Dict[str, Any]] = None
+_food_data_lock = threading.Lock()
+
+_model: Optional[Dict[str, Any]] = None
+_model_lock = threading.Lock()
+
+
+def get_food_data() -> Dict[str, Any]:
+    """Get the food name index, nutrient matrix and sorted names, loading once"""
+    global _food_data
+    if _food_data is None:
+        with _food_data_lock:
+            if _food_data is None:
+                food_idx, nutrients = load_food_tables()
+                all_foods = sorted(food_idx)
+                # GET /foods never changes between deploys: serialize it once
+                foods_json = json.dumps(
+                    {"foods": all_foods}, ensure_ascii=False, separators=(",", ":")
+                ).encode("utf-8")
+                _food_data = {
+                    "idx": food_idx,
+                    "nutrients": nutrients,
+                    "all_foods": all_foods,
+                    "foods_json": foods_json,
+                    "foods_etag": f'"{hashlib.sha256(foods_json).hexdigest()[:32]}"',
+                }
+    return _food_data
+
+
+def get_model() -> Dict[str, Any]:
+    """Get the forest bundle and its compiled predictor, loading it once"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model = dict(load_model_bundle())
+                model["predict"] = make_predictor(model)
+                _model = model
+    return _model
+
 
 # =========================
 # 4. ML PREDICTION FUNCTION (GRAM-BASED)
 # =========================
 
-def predict_adequacy_ml(weight, food_grams):
-    totals = {
-        "protein_g": 0,
-        "iron_mg": 0,
-        "b12_mcg": 0,
-        "omega3_g": 0,
-        "cal_kcal": 0
-    }
+def compute_totals(food_grams) -> np.ndarray:
+    """Nutrient totals for a meal, in FEATURES order"""
+    foods = get_food_data()
+    n = len(food_grams)
+    idxs = np.fromiter((foods["idx"][f] for f in food_grams), dtype=np.intp, count=n)
+    grams = np.fromiter(food_grams.values(), dtype=np.float64, count=n)
+    return (foods["nutrients"][idxs] * (grams / 100.0)[:, None]).sum(axis=0)
 
-    for food, grams in food_grams.items():
-        row = foods_df.loc[foods_df["name"] == food].iloc[0]
-        factor = grams / 100
 
-        totals["protein_g"] += row["protein_g"] * factor
-        totals["iron_mg"] += row["iron_mg"] * factor
-        totals["b12_mcg"] += row["b12_mcg"] * factor
-        totals["omega3_g"] += row["omega3_g"] * factor
-        totals["cal_kcal"] += row["cal_kcal"] * factor
+def predict_adequacy_ml(weight, food_grams):
+    # Only this debug path loads the forest and builds its predictor
+    model = get_model()
+    totals_arr = compute_totals(food_grams)
+    totals = {k: float(v) for k, v in zip(FEATURES, totals_arr)}
 
-    features = pd.DataFrame([totals])
-    pred = rf_model.predict(features)[0]
-    label = encoder.inverse_transform([pred])[0]
+    features = totals_arr.astype(np.float32).reshape(1, -1)
+    pred = model["predict"](features)[0]
+    label = model["enc"].inverse_transform([pred])[0]
 
     return totals, label
 
 
+def _compute_status(totals: Dict[str, float], weight: float) -> str:
+    """Apply the NAR rule directly to the meal totals"""
+    return generate_label(totals, weight)
+
+
+@lru_cache(maxsize=4096)
+def _evaluate_meal(weight: float, meal: Tuple[Tuple[str, float], ...], use_ml: bool = False):
+    if use_ml:
+        totals, label = predict_adequacy_ml(weight, dict(meal))
+    else:
+        totals = {k: float(v) for k, v in zip(FEATURES, compute_totals(dict(meal)))}
+        label = _compute_status(totals, weight)
+    reqs = compute_requirements(weight)
+    deficits = compute_deficits(totals, reqs)
+    # Plain dict for the response; this copy is itself cached with the meal
+    return totals, label, dict(reqs), deficits
+
+
+def evaluate_meal(weight: float, food_grams: Dict[str, float], use_ml: bool = False):
+    """Cached (weight, food_grams, totals, label, requirements, deficits) for a meal.
+
+    The label comes from the NAR rule the forest was trained to reproduce,
+    evaluated at the requested weight. The forest was only ever an
+    approximation of that rule and is kept behind use_ml for debugging.
+
+    Weight and grams are rounded to 0.1 so repeated UI submissions of the
+    same meal share a cache entry. The result is computed for those rounded
+    values, which are returned first so responses echo what was used; a
+    positive weight never rounds below 0.1. The returned totals,
+    requirements and deficits are shared between requests and must not be
+    mutated.
+    """
+    weight = max(round(weight, 1), 0.1)
+    food_grams = {k: round(v, 1) for k, v in food_grams.items()}
+    meal = tuple(sorted(food_grams.items()))
+    return (weight, food_grams) + _evaluate_meal(weight, meal, use_ml)
+
+
 class PredictRequest(BaseModel):
     weight: float = Field(..., gt=0)
     food_grams: Dict[str, float]
@@ -391,19 +866,41 @@ class HistoryCreateRequest(BaseModel):
     kind: str = Field(..., pattern="^(predict|search)$")
     payload: Dict[str, Any]
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag.
+
+    Accepts "*" and comma-separated lists, and compares weakly (a W/ prefix
+    on either side is ignored), as If-None-Match requires.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
 @app.get("/foods")
-def get_foods():
-    return {"foods": ALL_FOODS}
+def get_foods(request: Request):
+    foods = get_food_data()
+    etag = foods["foods_etag"]
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(
+        content=foods["foods_json"],
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
 
 
 @app.post("/predict")
-def predict(request: PredictRequest):
-    totals, label = predict_adequacy_ml(request.weight, request.food_grams)
-    reqs = compute_requirements(request.weight)
-    deficits = compute_deficits(totals, reqs)
+def predict(request: PredictRequest, use_ml: bool = False):
+    weight, food_grams, totals, label, reqs, deficits = evaluate_meal(
+        request.weight, request.food_grams, use_ml
+    )
     return {
-        "weight": request.weight,
-        "food_grams": request.food_grams,
+        "weight": weight,
+        "food_grams": food_grams,
         "totals": totals,
         "requirements": reqs,
         "deficits": deficits,
@@ -412,17 +909,17 @@ def predict(request: PredictRequest):
 
 
 @app.post("/calculate")
-def calculate(request: CalculateRequest):
+def calculate(request: CalculateRequest, use_ml: bool = False):
     if request.food_grams is not None:
         food_grams = request.food_grams
     else:
         food_grams = {f: 100 for f in request.foods}
 
-    totals, label = predict_adequacy_ml(request.weight, food_grams)
-    reqs = compute_requirements(request.weight)
-    deficits = compute_deficits(totals, reqs)
+    weight, food_grams, totals, label, reqs, deficits = evaluate_meal(
+        request.weight, food_grams, use_ml
+    )
     return {
-        "weight": request.weight,
+        "weight": weight,
         "selected_foods": request.foods,
         "food_grams": food_grams,
         "totals": totals,
@@ -432,6 +929,12 @@ def calculate(request: CalculateRequest):
     }
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    """Debug view of the /predict and /calculate meal cache"""
+    return _evaluate_meal.cache_info()._asdict()
+
+
 @app.post("/auth/register")
 async def register(req: RegisterRequest):
     """Register a new user"""
@@ -451,7 +954,7 @@ async def register(req: RegisterRequest):
     
     # Create user
     user_id = f"u_{os.urandom(8).hex()}"
-    password_hash = hash_password(req.password)
+    password_hash = await run_blocking(hash_password, req.password)
     
     await db.users.insert_one({
         "_id": user_id,
@@ -486,9 +989,15 @@ async def login(req: LoginRequest):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(req.password, user.get("password_hash", "")):
+    password_hash = user.get("password_hash", "")
+    if not await run_blocking(verify_password, req.password, password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Move hashes to the configured scheme, or up to the configured bcrypt cost
+    if password_needs_rehash(password_hash):
+        new_hash = await run_blocking(hash_password, req.password)
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {"password_hash": new_hash}})
+    
     # Generate token
     token = create_token(user["_id"], user["email"])
     
@@ -531,6 +1040,30 @@ async def list_history(
         q["kind"] = kind
     
     limit = max(1, min(int(limit), 200))
-    cursor = db.history.find(q, {"_id": 0}).sort("created_at", -1).limit(limit)
-    items = [doc async for doc in cursor]
-    return {"items": items}
+    cursor = (
+        db.history.find(q, HISTORY_PROJECTION)
+        .sort("created_at", -1)
+        .limit(limit)
+        .batch_size(HISTORY_BATCH_SIZE)
+    )
+    if history_indexes_ready:
+        # Hinting a missing index is a query error, so only after creation
+        cursor = cursor.hint(HISTORY_BY_USER_KIND if kind else HISTORY_BY_USER)
+    
+    # Fetch the first batch up front so query errors still become a normal
+    # error response instead of a truncated stream
+    batch = await cursor.to_list(length=HISTORY_BATCH_SIZE)
+    
+    async def encode_items():
+        nonlocal batch
+        yield b'{"items":['
+        sep = b""
+        while batch:
+            yield sep + b",".join(orjson.dumps(doc, option=ORJSON_OPTIONS) for doc in batch)
+            sep = b","
+            if len(batch) < HISTORY_BATCH_SIZE:
+                break
+            batch = await cursor.to_list(length=HISTORY_BATCH_SIZE)
+        yield b"]}"
+    
+    return StreamingResponse(encode_items(), media_type="application/json")
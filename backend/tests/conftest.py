@@ -0,0 +1,7 @@
+"""
+Shared pytest setup: make backend/main.py importable as `main`
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,34 @@
+"""
+Tests for password hashing configuration
+"""
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, 10),
+    ("12", 12),
+    ("4", 4),
+    ("31", 31),
+    ("2", 10),
+    ("32", 10),
+    ("ten", 10),
+    ("", 10),
+])
+def test_bcrypt_rounds(value, expected):
+    assert main._bcrypt_rounds(value) == expected
+
+
+@pytest.mark.skipif(not main.auth_available, reason="bcrypt / python-jose not installed")
+def test_needs_rehash_only_for_fewer_rounds(monkeypatch):
+    monkeypatch.setattr(main, "BCRYPT_ROUNDS", 5)
+    monkeypatch.setattr(main, "use_argon2", False)
+    weaker = main.bcrypt.hashpw(b"secret", main.bcrypt.gensalt(rounds=4)).decode()
+    same = main.hash_password("secret")
+    stronger = main.bcrypt.hashpw(b"secret", main.bcrypt.gensalt(rounds=6)).decode()
+
+    assert main.verify_password("secret", same)
+    assert main.password_needs_rehash(weaker)
+    assert not main.password_needs_rehash(same)
+    assert not main.password_needs_rehash(stronger)
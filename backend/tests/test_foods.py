@@ -0,0 +1,55 @@
+"""
+Tests for the food tables and GET /foods
+"""
+import numpy as np
+
+import main
+
+
+def test_food_tables_artifact_matches_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "FOODS_PATH", str(tmp_path / "foods.npz"))
+    csv_idx, csv_nutrients = main.index_foods(main.load_foods())
+
+    main.save_food_tables(main.load_foods())
+    idx, nutrients = main.load_food_tables()
+
+    assert sorted(idx) == sorted(csv_idx)
+    for name, row in csv_idx.items():
+        np.testing.assert_array_equal(nutrients[idx[name]], csv_nutrients[row])
+
+
+def test_stale_food_tables_fall_back_to_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "FOODS_PATH", str(tmp_path / "foods.npz"))
+    main.save_food_tables(main.load_foods())
+    monkeypatch.setattr(main, "dataset_sha256", lambda: "changed")
+
+    idx, nutrients = main.load_food_tables()
+    assert nutrients.shape[0] == len(main.load_foods())
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert main.etag_matches('"abc"', etag)
+    assert main.etag_matches('W/"abc"', etag)
+    assert main.etag_matches('"x", W/"abc" ,"y"', etag)
+    assert main.etag_matches("*", etag)
+    assert main.etag_matches('"abc"', 'W/"abc"')
+    assert not main.etag_matches(None, etag)
+    assert not main.etag_matches("", etag)
+    assert not main.etag_matches('"abcd", "ab"', etag)
+
+
+def test_get_foods_not_modified():
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    r = client.get("/foods")
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    assert main.get_food_data()["all_foods"] == r.json()["foods"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        r304 = client.get("/foods", headers={"If-None-Match": header})
+        assert r304.status_code == 304
+        assert r304.headers["etag"] == etag
+    assert client.get("/foods", headers={"If-None-Match": '"other"'}).status_code == 200
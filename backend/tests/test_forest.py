@@ -0,0 +1,71 @@
+"""
+Tests for the flattened forest predictors against RandomForestClassifier.predict
+"""
+import numpy as np
+import pytest
+
+import main
+
+pytest.importorskip("sklearn")
+
+
+@pytest.fixture(scope="module")
+def forest():
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(0)
+    X = rng.gamma(2.0, 10.0, size=(600, len(main.FEATURES))).astype(np.float32)
+    # Three classes, so soft voting over more than two columns is exercised
+    y = (X[:, 0] > 20).astype(int) + (X[:, 1] + X[:, 3] > 45).astype(int)
+    rf = RandomForestClassifier(n_estimators=16, max_depth=6, random_state=0, n_jobs=1)
+    rf.fit(X, y)
+    return rf, X
+
+
+@pytest.fixture(scope="module")
+def inputs(forest):
+    """Random rows, rows sitting exactly on (and next to) every split threshold,
+    and rows outside the training range"""
+    rf, X = forest
+    rng = np.random.default_rng(1)
+    rows = [X[rng.integers(len(X), size=200)]]
+    for est in rf.estimators_:
+        t = est.tree_
+        for node in np.flatnonzero(t.children_left != -1):
+            thr = np.float32(t.threshold[node])
+            for value in (thr, np.nextafter(thr, np.float32(-np.inf)), np.nextafter(thr, np.float32(np.inf))):
+                row = X[rng.integers(len(X))].copy()
+                row[t.feature[node]] = value
+                rows.append(row[None, :])
+    rows.append(np.full((1, X.shape[1]), -1.0, dtype=np.float32))
+    rows.append(np.full((1, X.shape[1]), 1e6, dtype=np.float32))
+    return np.concatenate(rows)
+
+
+def test_forest_walk_matches_sklearn(forest, inputs):
+    rf, _ = forest
+    # Plain Python run of the function make_predictor JIT-compiles
+    out = main._forest_walk(inputs, *main.flatten_forest(rf))
+    np.testing.assert_array_equal(out, rf.predict(inputs))
+
+
+def test_make_predictor_matches_sklearn(forest, inputs):
+    pytest.importorskip("numba")
+    rf, _ = forest
+    predict = main.make_predictor({"rf": rf})
+    assert predict != rf.predict
+    np.testing.assert_array_equal(predict(inputs), rf.predict(inputs))
+
+
+def test_compiled_forest_matches_sklearn(forest, inputs, tmp_path, monkeypatch):
+    pytest.importorskip("treelite")
+    pytest.importorskip("tl2cgen")
+    rf, _ = forest
+    monkeypatch.setattr(main, "MODEL_PATH", str(tmp_path / "model.joblib"))
+    try:
+        main.compile_forest(rf, str(tmp_path / "rf.so"))
+    except Exception as e:
+        pytest.skip(f"cannot compile forest: {e}")
+
+    predict = main.load_compiled_forest({"compiled_lib": "rf.so"})
+    np.testing.assert_array_equal(predict(inputs), rf.predict(inputs))
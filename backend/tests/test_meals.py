@@ -0,0 +1,54 @@
+"""
+Tests for meal evaluation in /predict and /calculate
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+def test_compute_status_matches_generate_label():
+    totals = {"protein_g": 80.0, "iron_mg": 6.0, "b12_mcg": 2.0, "omega3_g": 1.2, "cal_kcal": 900.0}
+    assert main._compute_status(totals, 60) == "Adequate"
+    assert main._compute_status(totals, 61) == "Inadequate"
+    assert main._compute_status(totals, 60) == main.generate_label(totals, 60)
+
+
+def test_compute_status_zero_weight():
+    totals = {"protein_g": 0.0, "iron_mg": 0.0, "b12_mcg": 0.0, "omega3_g": 0.0, "cal_kcal": 0.0}
+    assert main._compute_status(totals, 0.0) == "Inadequate"
+
+
+def test_predict_tiny_weight(client):
+    r = client.post("/predict", json={"weight": 0.04, "food_grams": {"Apple": 150}})
+    assert r.status_code == 200
+    assert r.json()["status"] == "Inadequate"
+
+
+def test_predict_returns_rounded_inputs(client):
+    r = client.post("/predict", json={"weight": 60.04, "food_grams": {"Apple": 150.04}})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["weight"] == 60.0
+    assert body["food_grams"] == {"Apple": 150.0}
+    assert body["requirements"]["protein_g"] == pytest.approx(60.0 * 1.32)
+
+    same = client.post("/predict", json={"weight": 60.0, "food_grams": {"Apple": 150.0}}).json()
+    assert same["totals"] == body["totals"]
+
+
+def test_positive_weight_never_rounds_to_zero(client):
+    body = client.post("/predict", json={"weight": 0.04, "food_grams": {"Apple": 150}}).json()
+    assert body["weight"] == 0.1
+    assert body["requirements"]["protein_g"] == pytest.approx(0.1 * 1.32)
+
+
+def test_calculate_defaults_to_100_grams(client):
+    body = client.post("/calculate", json={"weight": 60, "foods": ["Apple", "Banana"]}).json()
+    assert body["food_grams"] == {"Apple": 100, "Banana": 100}
+    assert body["selected_foods"] == ["Apple", "Banana"]
@@ -0,0 +1,29 @@
+"""
+Tests for the worker threadpool sizing
+"""
+import anyio
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_lifespan_sizes_threadpool():
+    with TestClient(main.app) as client:
+        tokens = client.portal.call(
+            lambda: anyio.to_thread.current_default_thread_limiter().total_tokens
+        )
+    assert tokens == main.THREADPOOL_SIZE
+
+
+def test_run_blocking_sizes_threadpool_once_per_loop():
+    async def run():
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        assert await main.run_blocking(sum, [1, 2]) == 3
+        assert limiter.total_tokens == main.THREADPOOL_SIZE
+
+        # Later calls on the same loop leave the limiter alone
+        limiter.total_tokens = 7
+        await main.run_blocking(sum, [])
+        return limiter.total_tokens
+
+    assert anyio.run(run) == 7